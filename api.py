@@ -1,10 +1,51 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import os
+from queue import Empty, Queue
+import threading
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+import orjson
 from predict import CreditRiskModel
 import pandas as pd
 import numpy as np
 
+# Micro-batching: rows already queued when the worker wakes are scored in
+# one call; a lone request is scored immediately
+BATCH_MAX_SIZE = 64
+PREDICT_TIMEOUT_S = 1.0
+
+# Bounded pool for CPU-bound SHAP work, overlapped with batched scoring.
+# One thread per in-flight request in this process: set API_THREADS to the
+# gunicorn --threads value (each worker gets its own pool)
+EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("API_THREADS", "2"))
+)
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """
+    Serve jsonify/request.json through orjson instead of stdlib json.
+    sort_keys, indent and default map onto orjson options; ensure_ascii
+    is ignored since orjson always emits UTF-8.
+    """
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_SERIALIZE_NUMPY
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        default = kwargs.get("default", self.default)
+        return orjson.dumps(obj, default=default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 CORS(app)  # Enable CORS for all routes
 
 # Initialize model
@@ -15,6 +56,47 @@ except Exception as e:
     print(f"Error loading model: {e}")
     model = None
 
+predict_queue = Queue()
+
+
+def _batch_worker():
+    while True:
+        batch = [predict_queue.get()]
+        # Take only what is already waiting; never hold a row for company
+        while len(batch) < BATCH_MAX_SIZE:
+            try:
+                batch.append(predict_queue.get_nowait())
+            except Empty:
+                break
+        try:
+            stack = np.vstack([row for row, _ in batch])
+            probs = model.predict_proba_batch(stack)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            continue
+        for (_, future), p in zip(batch, probs):
+            proba = float(p)
+            future.set_result((proba, int(proba >= 0.5)))
+
+
+def batched_predict_proba(inputs):
+    """Queue one feature row for the batch worker and wait for its score."""
+    future = Future()
+    # The row is this thread's reusable buffer; it stays untouched while we
+    # block on the result, and the worker copies it when stacking the batch
+    predict_queue.put((model._build_row_ndarray(inputs), future))
+    return future.result(timeout=PREDICT_TIMEOUT_S)
+
+
+if model:
+    # Compile the Hummingbird batch model now rather than on the worker
+    # thread, where the first large batch would stall every queued request
+    # past PREDICT_TIMEOUT_S. Kept out of CreditRiskModel.__init__ so the
+    # Streamlit UI doesn't pay for torch.
+    model._get_hb()
+    threading.Thread(target=_batch_worker, daemon=True).start()
+
 @app.route('/api/defaults', methods=['GET'])
 def get_defaults():
     if not model:
@@ -30,16 +112,33 @@ def predict():
     if not data:
         return jsonify({"error": "No input data provided"}), 400
 
+    # Reject bad input before queueing any model work
     try:
+        model.validate(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        # SHAP explanation runs on the pool while this thread waits on the
+        # batched prediction
+        shap_future = EXECUTOR.submit(model.explain_shap_topk, data, 20)
+
         # Predict
-        proba, pred = model.predict_proba(data)
+        try:
+            proba, pred = batched_predict_proba(data)
+        except FutureTimeoutError:
+            shap_future.cancel()
+            return jsonify({
+                "error": "Prediction timed out; the server is busy, "
+                         "please retry."
+            }), 503
         label, color = CreditRiskModel.risk_category(proba)
 
-        # SHAP explanation
-        shap_df, meta = model.explain_shap(data)
-
-        # Convert SHAP DataFrame to list of dicts for JSON response
-        shap_records = shap_df.head(20).to_dict(orient='records')
+        features, shap_vals, abs_vals, base_value, _ = shap_future.result()
+        shap_records = [
+            {"feature": f, "shap_value": v, "abs_shap": a}
+            for f, v, a in zip(features, shap_vals, abs_vals)
+        ]
 
         response = {
             "probability": proba,
@@ -47,8 +146,9 @@ def predict():
             "risk_label": label,
             "risk_color": color,
             "shap_values": shap_records,
-            "base_value": meta['base_value'],
-            "prediction_probability": meta['prediction_probability']
+            "base_value": base_value,
+            # Same scorer as "probability"; kept for frontend compatibility
+            "prediction_probability": proba
         }
         return jsonify(response)
 
@@ -14,7 +14,23 @@ def load_model():
     return CreditRiskModel()
 
 
-model = load_model()
+@st.cache_resource
+def load_importances():
+    """Top-20 feature importances, sorted once per model load."""
+    m = load_model()
+    importances = getattr(m.model, "feature_importances_", None)
+    if importances is None:
+        return None
+    return (
+        pd.DataFrame({
+            "feature": m.feature_names,
+            "importance": importances,
+        })
+        .sort_values("importance", ascending=False)
+        .head(20)
+        .set_index("feature")
+    )
+
 
 model = load_model()
 feature_names = model.feature_names
@@ -161,19 +177,15 @@ if st.button("Predict Risk", type="primary"):
 
     # Show the assembled feature row for transparency
     st.expander("View model-ready feature vector").write(
-        model.build_feature_vector(inputs)
+        model.build_feature_vector_df(inputs)
     )
 
     # Optional: simple feature importance display if available
     try:
-        importances = getattr(model.model, "feature_importances_", None)
-        if importances is not None:
-            imp_df = pd.DataFrame({
-                "feature": feature_names,
-                "importance": importances,
-            }).sort_values("importance", ascending=False)
+        imp_df = load_importances()
+        if imp_df is not None:
             st.subheader("Feature Importances")
-            st.bar_chart(imp_df.set_index("feature").head(20))
+            st.bar_chart(imp_df)
     except Exception as e:
         st.info(f"Feature importance not available: {e}")
 
@@ -1,4 +1,7 @@
+import copy
 import os
+import tempfile
+import threading
 from typing import Dict, List, Tuple
 import numpy as np  # noqa: F401  # reserved for future numerical ops
 import pandas as pd
@@ -10,14 +13,209 @@ try:
 except Exception:  # pragma: no cover
     shap = None  # will handle gracefully in explain_shap
 
+try:
+    import onnxruntime as ort
+except Exception:  # pragma: no cover
+    ort = None  # falls back to the native XGBoost booster
+
 MODEL_FILENAME = "xgboost_model.joblib"
 
+# XGBoost, ONNX Runtime and Hummingbird all evaluate splits in float32;
+# building rows in it avoids a float64 copy + downcast per request
+FEATURE_DTYPE = np.float32
+
+# Max abs probability difference allowed between an accelerated backend
+# (ONNX Runtime, Hummingbird) and the native booster
+PARITY_TOL = 1e-5
+
+# Smallest batch worth scoring with Hummingbird; smaller batches (including
+# single API requests) use the same ONNX/booster path as _score_row
+HB_MIN_BATCH_SIZE = 32
+
+# Accepted (min, max) per numeric input; mirrors the Streamlit form limits
+NUMERIC_RANGES = {
+    "person_age": (18, 100),
+    "person_income": (0, 1000000),
+    "person_emp_length": (0, 60),
+    "loan_amnt": (500, 1000000),
+    "loan_int_rate": (1.0, 60.0),
+    "loan_percent_income": (0.0, 1.0),
+    "cb_person_cred_hist_length": (0, 60),
+}
+NUMERIC_FEATURES = list(NUMERIC_RANGES)
+
+CATEGORICAL_OPTIONS = {
+    "person_home_ownership": {"OWN", "MORTGAGE", "RENT", "OTHER"},
+    "loan_intent": {
+        "DEBTCONSOLIDATION",
+        "HOMEIMPROVEMENT",
+        "EDUCATION",
+        "MEDICAL",
+        "PERSONAL",
+        "VENTURE",
+    },
+    "loan_grade": {"A", "B", "C", "D", "E", "F", "G"},
+    "cb_person_default_on_file": {"N", "Y"},
+}
+
+# Exact set of fields accepted by CreditRiskModel.validate
+INPUT_FIELDS = frozenset(NUMERIC_RANGES) | frozenset(CATEGORICAL_OPTIONS)
+
 class CreditRiskModel:
     def __init__(self, model_path: str = MODEL_FILENAME):
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"Model file not found: {model_path}")
         self.model = joblib.load(model_path)
+        self._booster = self.model.get_booster()
         self.feature_names = self._infer_feature_names()
+        self._col_idx = {name: i for i, name in enumerate(self.feature_names)}
+        # Per-categorical {value: column index}, e.g. {"RENT": 9}; grouped
+        # once since feature_names is fixed after load
+        self._cat_idx = {
+            prefix: {
+                col[len(prefix) + 1:]: self._col_idx[col] for col in cols
+            }
+            for prefix, cols in self._one_hot_columns().items()
+        }
+        # Per-thread feature row buffer, see _build_row_ndarray
+        self._tls = threading.local()
+        self._session = None
+        self._in_name = None
+        if ort is not None:
+            try:
+                onnx_path = self._convert_to_onnx(model_path)
+                options = ort.SessionOptions()
+                # ORT's thread pool ignores OMP_NUM_THREADS; 0 = all cores
+                options.intra_op_num_threads = int(
+                    os.environ.get("ORT_INTRA_OP_NUM_THREADS", "0")
+                )
+                self._session = ort.InferenceSession(
+                    onnx_path,
+                    sess_options=options,
+                    providers=["CPUExecutionProvider"],
+                )
+                self._in_name = self._session.get_inputs()[0].name
+                out = self._session.run(
+                    None, {self._in_name: self._parity_rows()}
+                )
+                if not self._matches_booster("ONNX", np.asarray(out[1])[:, 1]):
+                    self._session = None
+            except Exception as e:
+                self._session = None
+                warnings.warn(
+                    f"ONNX Runtime unavailable, using XGBoost booster: {e}"
+                )
+        # Hummingbird model is compiled on first batch call, see _get_hb
+        self._hb = None
+        self._hb_loaded = False
+        self._hb_lock = threading.Lock()
+        # SHAP TreeExplainer is built lazily once and reused across requests
+        self._explainer = None
+        self._base_logit = None
+        self._base_value = None
+        self._explainer_lock = threading.Lock()
+        self.warmup()
+
+    def warmup(self) -> None:
+        """
+        Run one prediction and one SHAP explanation so the first real
+        request doesn't pay for explainer construction and runtime init.
+        """
+        defaults = self.ideal_defaults()
+        try:
+            self.predict_proba(defaults)
+            self.predict_proba_batch(self._build_row_ndarray(defaults))
+            if shap is not None:
+                self.explain_shap_topk(defaults)
+        except Exception as e:
+            warnings.warn(f"Model warm-up failed: {e}")
+
+    def _parity_rows(self) -> np.ndarray:
+        """A few low- and high-risk rows for backend parity checks."""
+        low = self.ideal_defaults()
+        high = dict(
+            low,
+            person_income=25000,
+            loan_amnt=20000,
+            loan_int_rate=22.0,
+            loan_percent_income=0.6,
+            person_home_ownership="RENT",
+            loan_intent="MEDICAL",
+            loan_grade="E",
+            cb_person_default_on_file="Y",
+        )
+        mid = dict(
+            low,
+            person_home_ownership="MORTGAGE",
+            loan_intent="VENTURE",
+            loan_grade="C",
+            loan_percent_income=0.35,
+        )
+        # Own array rather than the thread's row buffer, which a caller
+        # may still be holding
+        samples = (low, mid, high)
+        rows = np.zeros(
+            (len(samples), len(self.feature_names)), dtype=FEATURE_DTYPE
+        )
+        for row, sample in zip(rows, samples):
+            self._fill_row(row, sample)
+        return rows
+
+    def _matches_booster(self, backend: str, probs: np.ndarray) -> bool:
+        """
+        Compare a backend's probabilities for _parity_rows() against the
+        native booster; warn and return False if they disagree.
+        """
+        rows = self._parity_rows()
+        expected = np.asarray(self._booster.inplace_predict(rows))
+        diff = float(np.max(np.abs(np.ravel(probs) - expected)))
+        if not diff <= PARITY_TOL:
+            warnings.warn(
+                f"{backend} predictions differ from XGBoost by {diff:.2e}; "
+                "using the XGBoost booster instead"
+            )
+            return False
+        return True
+
+    def _convert_to_onnx(self, model_path: str) -> str:
+        """
+        Export the model to ONNX next to the joblib file and return its
+        path. The export is cached and only redone when the joblib is newer.
+        """
+        onnx_path = os.path.splitext(model_path)[0] + ".onnx"
+        if os.path.exists(onnx_path) and (
+            os.path.getmtime(onnx_path) >= os.path.getmtime(model_path)
+        ):
+            return onnx_path
+
+        from onnxmltools import convert_xgboost
+        from onnxmltools.convert.common.data_types import FloatTensorType
+
+        # The converter parses split features as f0..fN, so strip the
+        # feature names and types on a copy; __init__ checks the exported
+        # model against the booster before using it
+        clf = copy.deepcopy(self.model)
+        booster = clf.get_booster()
+        booster.feature_names = None
+        booster.feature_types = None
+        onnx_model = convert_xgboost(
+            clf,
+            initial_types=[
+                ("input", FloatTensorType([None, len(self.feature_names)]))
+            ],
+        )
+        # Write then rename so concurrent workers never load a partial file
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(onnx_path)), suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(onnx_model.SerializeToString())
+            os.replace(tmp_path, onnx_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return onnx_path
 
     def _infer_feature_names(self) -> List[str]:
         # Preferred: sklearn-style feature names
@@ -103,142 +301,151 @@ class CreditRiskModel:
                 groups["cb_person_default_on_file"].append(col)
         return groups
 
-    def _make_background(self, n: int = 200) -> pd.DataFrame:
+    def validate(self, inputs: Dict[str, object]) -> None:
         """
-        Create a synthetic background dataset for SHAP interventional
-        explainer. The ranges are heuristic but aligned with common
-        credit datasets.
+        Raise ValueError if inputs has unknown or missing keys, non-numeric
+        or out-of-range numbers, or unrecognised categorical values.
         """
-        defaults = self.ideal_defaults()
-        rng = np.random.default_rng(42)
-
-        home_opts = ["OWN", "MORTGAGE", "RENT", "OTHER"]
-        intent_opts = [
-            "DEBTCONSOLIDATION",
-            "HOMEIMPROVEMENT",
-            "EDUCATION",
-            "MEDICAL",
-            "PERSONAL",
-            "VENTURE",
-        ]
-        grade_opts = ["A", "B", "C", "D", "E", "F", "G"]
-        cb_opts = ["N", "Y"]
-
-        rows: List[pd.DataFrame] = []
-        for _ in range(n):
-            sample = {
-                "person_age": float(
-                    np.clip(
-                        rng.normal(defaults["person_age"], 8.0), 18, 90
-                    )
-                ),
-                "person_income": float(
-                    np.clip(
-                        rng.normal(defaults["person_income"], 30000.0),
-                        10000,
-                        300000,
-                    )
-                ),
-                "person_emp_length": float(
-                    np.clip(
-                        rng.normal(defaults["person_emp_length"], 3.0), 0, 40
-                    )
-                ),
-                "loan_amnt": float(
-                    np.clip(
-                        rng.normal(defaults["loan_amnt"], 8000.0), 500, 100000
-                    )
-                ),
-                "loan_int_rate": float(
-                    np.clip(
-                        rng.normal(defaults["loan_int_rate"], 5.0), 1.0, 40.0
-                    )
-                ),
-                "loan_percent_income": float(
-                    np.clip(
-                        rng.normal(defaults["loan_percent_income"], 0.08),
-                        0.0,
-                        1.0,
-                    )
-                ),
-                "cb_person_cred_hist_length": float(
-                    np.clip(
-                        rng.normal(
-                            defaults["cb_person_cred_hist_length"], 5.0
-                        ),
-                        0,
-                        40,
-                    )
-                ),
-                "person_home_ownership": rng.choice(home_opts),
-                "loan_intent": rng.choice(intent_opts),
-                "loan_grade": rng.choice(grade_opts),
-                "cb_person_default_on_file": rng.choice(cb_opts),
-            }
-            rows.append(self.build_feature_vector(sample))
-        bg = pd.concat(rows, ignore_index=True)
-        return bg
+        if not isinstance(inputs, dict):
+            raise ValueError("Input must be a JSON object")
+        unknown = set(inputs) - INPUT_FIELDS
+        if unknown:
+            raise ValueError(f"Unknown input fields: {sorted(unknown)}")
+        missing = INPUT_FIELDS - set(inputs)
+        if missing:
+            raise ValueError(f"Missing input fields: {sorted(missing)}")
 
-    def build_feature_vector(self, inputs: Dict[str, object]) -> pd.DataFrame:
+        for name, (low, high) in NUMERIC_RANGES.items():
+            value = inputs[name]
+            if isinstance(value, bool):
+                raise ValueError(f"{name} must be a number")
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{name} must be a number")
+            if not low <= value <= high:
+                raise ValueError(f"{name} must be between {low} and {high}")
+
+        for name, options in CATEGORICAL_OPTIONS.items():
+            value = inputs[name]
+            # Case-insensitive, matching _fill_row's normalisation
+            if not isinstance(value, str) or value.upper() not in options:
+                raise ValueError(
+                    f"{name} must be one of {sorted(options)}, "
+                    f"got {value!r}"
+                )
+
+    def _build_row_ndarray(self, inputs: Dict[str, object]) -> np.ndarray:
         """
-        Build a single-row DataFrame matching the model's feature_names order.
+        Build a (1, n_features) float32 row in the model's feature_names
+        order. This is what the scoring and SHAP paths consume directly.
+
+        The array is a per-thread scratch buffer reused across calls, so it
+        is only valid until the next call on the same thread; copy it to
+        keep it.
         """
-        # Start with zeros for all features
-        data = {name: 0.0 for name in self.feature_names}
+        buf = getattr(self._tls, "buf", None)
+        if buf is None:
+            buf = np.zeros((1, len(self.feature_names)), dtype=FEATURE_DTYPE)
+            self._tls.buf = buf
+            self._tls.row = buf.reshape(-1)
+        else:
+            buf.fill(0.0)
+        self._fill_row(self._tls.row, inputs)
+        return buf
 
+    def _fill_row(self, row: np.ndarray, inputs: Dict[str, object]) -> None:
+        """Write inputs into a zeroed 1-D row in feature_names order."""
         # Numeric assignments (if present in features)
-        numeric_map = {
-            "person_age": float(inputs.get("person_age", 0)),
-            "person_income": float(inputs.get("person_income", 0)),
-            "person_emp_length": float(inputs.get("person_emp_length", 0)),
-            "loan_amnt": float(inputs.get("loan_amnt", 0)),
-            "loan_int_rate": float(inputs.get("loan_int_rate", 0)),
-            "loan_percent_income": float(inputs.get("loan_percent_income", 0)),
-            "cb_person_cred_hist_length": float(
-                inputs.get("cb_person_cred_hist_length", 0)
-            ),
-        }
-        for k, v in numeric_map.items():
-            if k in data:
-                data[k] = v
-
-        # One-hot assignments
-        groups = self._one_hot_columns()
-        # person_home_ownership
-        pho_val = str(inputs.get("person_home_ownership", "")).upper()
-        for col in groups.get("person_home_ownership", []):
-            # col like person_home_ownership_RENT
-            if col.endswith(f"_{pho_val}"):
-                data[col] = 1.0
-        # loan_intent
-        li_val = str(inputs.get("loan_intent", "")).upper()
-        for col in groups.get("loan_intent", []):
-            if col.endswith(f"_{li_val}"):
-                data[col] = 1.0
-        # loan_grade
-        lg_val = str(inputs.get("loan_grade", "")).upper()
-        for col in groups.get("loan_grade", []):
-            if col.endswith(f"_{lg_val}"):
-                data[col] = 1.0
-        # cb_person_default_on_file -> typically only _Y dummy
-        cb_val = str(inputs.get("cb_person_default_on_file", "")).upper()
-        for col in groups.get("cb_person_default_on_file", []):
-            # set 1.0 if user selected Y
-            if col.endswith("_Y") and cb_val == "Y":
-                data[col] = 1.0
-
-        # Return as DataFrame with ordered columns
-        df_row = pd.DataFrame(
-            [[data[name] for name in self.feature_names]],
-            columns=self.feature_names,
-        )
+        for name in NUMERIC_FEATURES:
+            idx = self._col_idx.get(name)
+            if idx is not None:
+                row[idx] = float(inputs.get(name, 0))
+
+        # One-hot assignments (case-insensitive, as in validate); the
+        # dropped reference level has no column
+        for prefix, lookup in self._cat_idx.items():
+            value = str(inputs.get(prefix, "")).upper()
+            idx = lookup.get(value)
+            if idx is not None:
+                row[idx] = 1.0
+
+    def build_feature_vector_df(
+        self, inputs: Dict[str, object]
+    ) -> pd.DataFrame:
+        """
+        Build a single-row DataFrame matching the model's feature_names order.
+        Only used for display; inference works on the raw ndarray.
+        """
+        # Copy: the row buffer is reused by the next prediction on this thread
+        row = self._build_row_ndarray(inputs).copy()
+        df_row = pd.DataFrame(row, columns=self.feature_names, copy=False)
         return df_row
 
+    def _score_row(self, row: np.ndarray) -> float:
+        row = row.reshape(1, -1).astype(FEATURE_DTYPE, copy=False)
+        if self._session is not None:
+            # Outputs are [label, probabilities]; column 1 is risk/positive
+            out = self._session.run(None, {self._in_name: row})
+            return float(out[1][0][1])
+        # inplace_predict skips DMatrix construction; for binary:logistic it
+        # returns the positive (risk) class probability directly
+        return float(self._booster.inplace_predict(row)[0])
+
+    def _get_hb(self):
+        """
+        Return the Hummingbird-compiled model, compiling it on first use.
+        None if hummingbird-ml is not installed, compilation fails, or the
+        result does not match the booster.
+        """
+        if not self._hb_loaded:
+            with self._hb_lock:
+                if not self._hb_loaded:
+                    self._hb = self._compile_hummingbird()
+                    self._hb_loaded = True
+        return self._hb
+
+    def _compile_hummingbird(self):
+        try:
+            from hummingbird.ml import convert
+        except Exception:
+            return None  # optional; batch scoring uses ONNX / booster
+        try:
+            # Tree ensemble compiled to tensor ops (GEMM)
+            hb = convert(
+                self.model,
+                "torch",
+                extra_config={"tree_implementation": "gemm"},
+            )
+            probs = np.asarray(hb.predict_proba(self._parity_rows()))[:, 1]
+        except Exception as e:
+            warnings.warn(f"Hummingbird compilation failed: {e}")
+            return None
+        if not self._matches_booster("Hummingbird", probs):
+            return None
+        return hb
+
+    def predict_proba_batch(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Return the risk probability for each row of an (n, n_features)
+        float32 matrix. Batches of at least HB_MIN_BATCH_SIZE rows use the
+        Hummingbird-compiled model when available.
+        """
+        rows = np.ascontiguousarray(rows, dtype=FEATURE_DTYPE)
+        if len(rows) >= HB_MIN_BATCH_SIZE:
+            hb = self._get_hb()
+            if hb is not None:
+                return np.asarray(hb.predict_proba(rows))[:, 1]
+        if self._session is not None:
+            out = self._session.run(None, {self._in_name: rows})
+            return np.asarray(out[1])[:, 1]
+        return np.asarray(self._booster.inplace_predict(rows))
+
     def predict_proba(self, inputs: Dict[str, object]) -> Tuple[float, int]:
-        X_row = self.build_feature_vector(inputs)
-        # XGBoost returns proba for both classes; assume 1 is risk/positive
-        proba = float(self.model.predict_proba(X_row)[:, 1][0])
-        pred = int(self.model.predict(X_row)[0])
+        row = self._build_row_ndarray(inputs)
+        proba = self._score_row(row)
+        # Same 0.5 threshold as model.predict, without a second tree pass
+        pred = int(proba >= 0.5)
         return proba, pred
 
     @staticmethod
@@ -251,39 +458,68 @@ class CreditRiskModel:
         else:
             return "High Risk", "#c62828"  # red
 
-    def explain_shap(
-        self, inputs: Dict[str, object]
-    ) -> Tuple[pd.DataFrame, Dict[str, float]]:
+    def _get_tree_explainer(self):
+        """Return the cached TreeExplainer, building it on first use."""
+        if self._explainer is None:
+            with self._explainer_lock:
+                # Re-check: another thread may have built it while we waited
+                if self._explainer is None:
+                    # Path-dependent TreeSHAP needs no background data but
+                    # explains the raw log-odds margin
+                    explainer = shap.TreeExplainer(
+                        self.model,
+                        feature_perturbation="tree_path_dependent",
+                    )
+                    self._base_logit = float(
+                        np.ravel(explainer.expected_value)[0]
+                    )
+                    self._base_value = float(
+                        1.0 / (1.0 + np.exp(-self._base_logit))
+                    )
+                    self._explainer = explainer
+        return self._explainer
+
+    def _log_odds_to_probability(
+        self, shap_arr: np.ndarray
+    ) -> Tuple[np.ndarray, float]:
         """
-        Compute SHAP contributions for a single prediction.
+        Rescale log-odds SHAP values so they sum to the change in
+        probability from the base value. The factor is always positive,
+        so signs and ranking are preserved.
 
-        Returns:
-            (df, meta):
-              - df: DataFrame with columns [feature, shap_value, abs_shap]
-              - meta: dict with keys like base_value and prediction_probability
+        Returns the rescaled values and the model probability, which is
+        sigmoid(base log-odds + sum of contributions).
         """
+        total = float(shap_arr.sum())
+        proba = float(1.0 / (1.0 + np.exp(-(self._base_logit + total))))
+        if abs(total) < 1e-12:
+            # Limit of the secant is the sigmoid slope at the base value
+            scale = self._base_value * (1.0 - self._base_value)
+        else:
+            scale = (proba - self._base_value) / total
+        return shap_arr * scale, proba
+
+    def _compute_shap(
+        self, inputs: Dict[str, object]
+    ) -> Tuple[np.ndarray, float, float]:
+        """Return (shap_arr, base_value, prediction_probability)."""
         if shap is None:
             raise RuntimeError(
                 "SHAP is not installed. Please install 'shap' "
                 "to use explanations."
             )
 
-        X_row = self.build_feature_vector(inputs)
+        X_row = self._build_row_ndarray(inputs)
 
-        # Try TreeExplainer with probability output
-        explainer = None
+        # Try the cached TreeExplainer (log-odds output)
         shap_values = None
         base_value = None
+        log_odds = False
         try:
-            background = self._make_background(n=200)
-            explainer = shap.TreeExplainer(
-                self.model,
-                data=background,
-                feature_perturbation="interventional",
-                model_output="probability",
-            )
+            explainer = self._get_tree_explainer()
             shap_values = explainer.shap_values(X_row)
-            base_value = float(np.ravel(explainer.expected_value)[0])
+            base_value = self._base_value
+            log_odds = True
         except Exception as e:
             warnings.warn(
                 f"TreeExplainer failed, fallback to generic Explainer: {e}"
@@ -302,6 +538,25 @@ class CreditRiskModel:
             shap_arr = np.array(shap_values[1]).reshape(-1)
         else:
             shap_arr = np.array(shap_values).reshape(-1)
+        if log_odds:
+            # The margin is already explained, so no extra scoring pass
+            shap_arr, proba = self._log_odds_to_probability(shap_arr)
+        else:
+            proba = self._score_row(X_row)
+        return shap_arr, base_value, proba
+
+    def explain_shap(
+        self, inputs: Dict[str, object]
+    ) -> Tuple[pd.DataFrame, Dict[str, float]]:
+        """
+        Compute SHAP contributions for a single prediction.
+
+        Returns:
+            (df, meta):
+              - df: DataFrame with columns [feature, shap_value, abs_shap]
+              - meta: dict with keys like base_value and prediction_probability
+        """
+        shap_arr, base_value, proba = self._compute_shap(inputs)
 
         df = pd.DataFrame(
             {
@@ -312,10 +567,38 @@ class CreditRiskModel:
         df["abs_shap"] = df["shap_value"].abs()
         df = df.sort_values("abs_shap", ascending=False).reset_index(drop=True)
 
-        proba, _ = self.predict_proba(inputs)
         meta = {"base_value": base_value, "prediction_probability": proba}
         return df, meta
 
+    def explain_shap_topk(
+        self, inputs: Dict[str, object], k: int = 20
+    ) -> Tuple[List[str], List[float], List[float], float, float]:
+        """
+        Like explain_shap, but return only the k largest contributions as
+        plain lists, skipping pandas. Used by the JSON API.
+
+        Returns:
+            (features, shap_values, abs_shap, base_value,
+             prediction_probability), ordered by descending abs_shap.
+        """
+        shap_arr, base_value, proba = self._compute_shap(inputs)
+
+        absv = np.abs(shap_arr)
+        if k < absv.size:
+            idx = np.argpartition(-absv, k)[:k]
+        else:
+            idx = np.arange(absv.size)
+        idx = idx[np.argsort(-absv[idx], kind="stable")]
+
+        features = [self.feature_names[i] for i in idx]
+        return (
+            features,
+            shap_arr[idx].tolist(),
+            absv[idx].tolist(),
+            base_value,
+            proba,
+        )
+
 
 if __name__ == "__main__":
     # Simple CLI sanity test
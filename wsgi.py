@@ -0,0 +1,23 @@
+"""
+WSGI entry point for serving the Flask API with a multi-worker server:
+
+    gunicorn -w 4 -k gthread --threads 2 -b 0.0.0.0:5000 wsgi:app
+
+Each worker imports this module once, so the model is loaded per worker
+rather than per request. Do not use --preload: the batching thread started
+in api.py does not survive the fork into workers.
+"""
+import os
+
+# One BLAS/OpenMP/ONNX Runtime thread per worker; parallelism comes from
+# the workers.
+# Must be set before numpy/xgboost are imported.
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("MKL_NUM_THREADS", "1")
+os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
+# ONNX Runtime sizes its own pool; read by CreditRiskModel
+os.environ.setdefault("ORT_INTRA_OP_NUM_THREADS", "1")
+
+from api import app  # noqa: E402
+
+__all__ = ["app"]